@@ -1,20 +1,31 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+import time
+
+# Measured from the first import so the startup budget covers module loading
+STARTUP_STARTED = time.perf_counter()
+
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, WebSocket, WebSocketDisconnect
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response
 import os
+import asyncio
 import logging
+import io
+import importlib.util
+import heapq
+import itertools
+import random
+from contextvars import ContextVar
+from contextlib import asynccontextmanager, contextmanager
+from functools import lru_cache
 from pathlib import Path
 from pydantic import BaseModel, Field, EmailStr
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Set
 import uuid
 from datetime import datetime, timedelta
-from emergentintegrations.llm.chat import LlmChat, UserMessage
 import jwt
-from passlib.context import CryptContext
-import bcrypt
-import requests
 import json
 
 ROOT_DIR = Path(__file__).parent
@@ -25,20 +36,93 @@ SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key-change-this-in-product
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# Real-time classroom channel settings
+CLASSROOM_SEND_BUFFER = int(os.getenv("CLASSROOM_SEND_BUFFER", "100"))
+CLASSROOM_SEND_TIMEOUT = float(os.getenv("CLASSROOM_SEND_TIMEOUT", "5"))
+CLASSROOM_AUTH_TIMEOUT = float(os.getenv("CLASSROOM_AUTH_TIMEOUT", "10"))
+
+# Background report job settings
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", "2"))
+REPORT_CACHE_TTL_SECONDS = int(os.getenv("REPORT_CACHE_TTL_SECONDS", "300"))
+# Finished jobs and their payloads are removed by a TTL index after this long
+REPORT_RETENTION_SECONDS = int(os.getenv("REPORT_RETENTION_SECONDS", str(7 * 24 * 3600)))
+# Payloads are split across documents to stay well under MongoDB's 16 MB limit
+REPORT_PAYLOAD_CHUNK_BYTES = 4 * 1024 * 1024
+REPORT_SETUP_RETRY_SECONDS = 1
+REPORT_SETUP_MAX_RETRY_SECONDS = 60
+
+# MongoDB pool settings, unset values keep the driver defaults
+MONGO_POOL_SETTINGS = {
+    "maxPoolSize": ("MONGO_MAX_POOL_SIZE", int),
+    "minPoolSize": ("MONGO_MIN_POOL_SIZE", int),
+    "maxIdleTimeMS": ("MONGO_MAX_IDLE_TIME_MS", int),
+    "waitQueueTimeoutMS": ("MONGO_WAIT_QUEUE_TIMEOUT_MS", int),
+    "connectTimeoutMS": ("MONGO_CONNECT_TIMEOUT_MS", int),
+    "socketTimeoutMS": ("MONGO_SOCKET_TIMEOUT_MS", int),
+    "serverSelectionTimeoutMS": ("MONGO_SERVER_SELECTION_TIMEOUT_MS", int),
+    "compressors": ("MONGO_COMPRESSORS", str),  # e.g. "zstd,snappy"
+}
+
+# Admin analytics use their own pool, prefer secondaries and are time limited
+ANALYTICS_MAX_POOL_SIZE = int(os.getenv("MONGO_ANALYTICS_MAX_POOL_SIZE", "10"))
+ANALYTICS_READ_PREFERENCE = os.getenv("MONGO_ANALYTICS_READ_PREFERENCE", "secondaryPreferred")
+ANALYTICS_MAX_TIME_MS = int(os.getenv("MONGO_ANALYTICS_MAX_TIME_MS", "15000"))
+# Background reports exist for large scans, 0 leaves them without a server-side limit
+REPORT_MAX_TIME_MS = int(os.getenv("MONGO_REPORT_MAX_TIME_MS", "0")) or None
+
+# Request profiling settings, nothing is installed unless PROFILE_REQUESTS is set
+PROFILE_REQUESTS = os.getenv("PROFILE_REQUESTS", "false").lower() == "true"
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_TRACE_LIMIT = int(os.getenv("PROFILE_TRACE_LIMIT", "50"))
+PROFILE_HEADER = b"x-debug-profile"
+
+# Cold start target, a warning is logged when startup takes longer
+STARTUP_BUDGET_SECONDS = float(os.getenv("STARTUP_BUDGET_SECONDS", "1.0"))
+
 # Admin credentials
 ADMIN_EMAIL = os.getenv("ADMIN_EMAIL", "admin@cl-scripter.com")
 ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD", "scripter2024")  # Change this in production
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# MongoDB connections, opened by the application lifespan
+client = None
+db = None
+analytics_client = None
+analytics_db = None
+
+def mongo_pool_options() -> Dict[str, Any]:
+    options = {}
+    for option, (env_name, cast) in MONGO_POOL_SETTINGS.items():
+        value = os.getenv(env_name)
+        if value:
+            options[option] = cast(value)
+    return options
 
-# Create the main app without a prefix
-app = FastAPI()
+def connect_db():
+    global client, db, analytics_client, analytics_db
+    from motor.motor_asyncio import AsyncIOMotorClient
+    
+    mongo_url = os.environ['MONGO_URL']
+    options = mongo_pool_options()
+    if PROFILE_REQUESTS:
+        from pymongo import monitoring
+        
+        # pymongo only accepts listeners derived from its own base classes
+        listener_class = type("MongoCommandProfiler", (MongoProfilingListener, monitoring.CommandListener), {})
+        options["event_listeners"] = [listener_class()]
+    client = AsyncIOMotorClient(mongo_url, **options)
+    db = client[os.environ['DB_NAME']]
+    
+    # A separate pool keeps dashboard scans from starving the autosave path
+    analytics_options = {**options, "maxPoolSize": ANALYTICS_MAX_POOL_SIZE}
+    analytics_options.pop("minPoolSize", None)
+    analytics_client = AsyncIOMotorClient(
+        mongo_url,
+        readPreference=ANALYTICS_READ_PREFERENCE,
+        **analytics_options
+    )
+    analytics_db = analytics_client[os.environ['DB_NAME']]
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -127,12 +211,46 @@ class AdminDashboard(BaseModel):
     tutorial_stats: List[TutorialStats]
     recent_activity: List[Dict[str, Any]]
 
+# Background report job models
+REPORT_KINDS = {"dashboard", "users", "errors"}
+REPORT_FORMATS = {"json", "csv", "parquet"}
+REPORT_TABULAR_KINDS = {"users", "errors"}
+
+class ReportJobRequest(BaseModel):
+    kind: str
+    format: str = "json"
+    limit: Optional[int] = Field(None, gt=0, le=1000)
+    refresh: bool = False
+
+class ReportJob(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    kind: str
+    format: str = "json"
+    params: Dict[str, Any] = {}
+    params_key: str
+    status: str = "queued"  # queued, running, completed, failed or cancelled
+    requested_by: str
+    error: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    payload_size: Optional[int] = None
+
 # Auth utility functions
+@lru_cache(maxsize=None)
+def get_pwd_context():
+    # passlib and bcrypt are only loaded once a password is checked
+    from passlib.context import CryptContext
+    
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    with profile_span("cpu", "bcrypt verify"):
+        return get_pwd_context().verify(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    with profile_span("cpu", "bcrypt hash"):
+        return get_pwd_context().hash(password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -144,25 +262,30 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+async def get_user_from_token(token: str) -> Optional[User]:
     try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id: str = payload.get("sub")
         if user_id is None:
-            raise credentials_exception
+            return None
     except jwt.PyJWTError:
-        raise credentials_exception
+        return None
     
     user = await db.users.find_one({"id": user_id})
     if user is None:
-        raise credentials_exception
+        return None
     return User(**user)
 
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    user = await get_user_from_token(credentials.credentials)
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return user
+
 async def get_admin_user(current_user: User = Depends(get_current_user)):
     if not current_user.is_admin:
         raise HTTPException(
@@ -215,6 +338,7 @@ class CodeExecutionResponse(BaseModel):
 # Online compiler function
 async def execute_code_online(language: str, code: str) -> CodeExecutionResponse:
     """Execute code using online compiler APIs"""
+    import requests
     
     # Language mapping for different APIs
     language_map = {
@@ -248,7 +372,8 @@ async def execute_code_online(language: str, code: str) -> CodeExecutionResponse
         }
         
         start_time = datetime.utcnow()
-        response = requests.post(api_url, headers=headers, json=payload, timeout=10)
+        with profile_span("http", "jdoodle execute"):
+            response = requests.post(api_url, headers=headers, json=payload, timeout=10)
         end_time = datetime.utcnow()
         
         execution_time = (end_time - start_time).total_seconds()
@@ -277,6 +402,266 @@ async def execute_code_online(language: str, code: str) -> CodeExecutionResponse
     except Exception as e:
         return CodeExecutionResponse(error=f"Execution error: {str(e)}")
 
+# Real-time classroom channel
+class ClassroomConnection:
+    """A subscribed WebSocket with its own bounded send buffer"""
+    
+    def __init__(self, websocket: WebSocket, rooms: Set[str], max_buffer: int):
+        self.websocket = websocket
+        self.rooms = rooms
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_buffer)
+        self.dropped = asyncio.Event()
+    
+    def offer(self, event: Dict[str, Any]) -> bool:
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except asyncio.QueueFull:
+            return False
+    
+    async def _send_loop(self):
+        while True:
+            event = await self.queue.get()
+            try:
+                await asyncio.wait_for(self.websocket.send_json(event), timeout=CLASSROOM_SEND_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.warning(f"Dropping classroom consumer subscribed to {sorted(self.rooms)} after a send timeout")
+                self.dropped.set()
+                return
+    
+    async def _receive_loop(self):
+        # Clients only listen; reading keeps pings flowing and detects disconnects
+        while True:
+            await self.websocket.receive_text()
+    
+    async def run(self):
+        tasks = [
+            asyncio.create_task(self._send_loop()),
+            asyncio.create_task(self._receive_loop()),
+            asyncio.create_task(self.dropped.wait()),
+        ]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        
+        if self.dropped.is_set():
+            try:
+                await self.websocket.close(code=1013, reason="Slow consumer")
+            except Exception:
+                pass
+
+class ClassroomHub:
+    """Fans out progress and execution events to the connections in each room"""
+    
+    def __init__(self, max_buffer: int = CLASSROOM_SEND_BUFFER):
+        self.max_buffer = max_buffer
+        self.rooms: Dict[str, Set[ClassroomConnection]] = {}
+    
+    def connect(self, websocket: WebSocket, rooms: Set[str]) -> ClassroomConnection:
+        connection = ClassroomConnection(websocket, rooms, self.max_buffer)
+        for room in rooms:
+            self.rooms.setdefault(room, set()).add(connection)
+        return connection
+    
+    def disconnect(self, connection: ClassroomConnection):
+        for room in connection.rooms:
+            members = self.rooms.get(room)
+            if members is None:
+                continue
+            members.discard(connection)
+            if not members:
+                del self.rooms[room]
+    
+    def publish(self, rooms: List[str], event: Dict[str, Any]):
+        # A connection subscribed to several rooms still receives each event once
+        targets: Set[ClassroomConnection] = set()
+        for room in rooms:
+            targets.update(self.rooms.get(room, ()))
+        
+        for connection in targets:
+            if not connection.offer(event):
+                logger.warning(f"Dropping slow classroom consumer subscribed to {sorted(connection.rooms)}")
+                self.disconnect(connection)
+                connection.dropped.set()
+
+classroom_hub = ClassroomHub()
+
+def publish_classroom_event(event_type: str, user_id: Optional[str], language: str, tutorial_id: Optional[int], **extra):
+    """Broadcast an event to the global, per-language and per-user rooms"""
+    event = {
+        "type": event_type,
+        "user_id": user_id,
+        "language": language,
+        "tutorial_id": tutorial_id,
+        "timestamp": datetime.utcnow().isoformat(),
+        **extra
+    }
+    rooms = ["all", f"language:{language}"]
+    if user_id:
+        rooms.append(f"user:{user_id}")
+    classroom_hub.publish(rooms, event)
+
+# Request profiling
+class RequestTrace:
+    """Span breakdown of a single profiled request"""
+    
+    def __init__(self, method: str, path: str, reason: str):
+        self.id = str(uuid.uuid4())
+        self.method = method
+        self.path = path
+        self.reason = reason
+        self.status_code: Optional[int] = None
+        self.started_at = datetime.utcnow()
+        self.started = time.perf_counter()
+        self.duration_ms = 0.0
+        self.spans: List[Dict[str, Any]] = []
+    
+    def add_span(self, kind: str, name: str, duration_ms: float, **details):
+        # Spans are recorded when they end, so their start is derived from the duration
+        start_ms = (time.perf_counter() - self.started) * 1000 - duration_ms
+        self.spans.append({
+            "kind": kind,
+            "name": name,
+            "start_ms": round(start_ms, 3),
+            "duration_ms": round(duration_ms, 3),
+            **details
+        })
+    
+    def finish(self):
+        self.duration_ms = (time.perf_counter() - self.started) * 1000
+    
+    def to_dict(self) -> Dict[str, Any]:
+        totals: Dict[str, float] = {}
+        for span in self.spans:
+            totals[span["kind"]] = totals.get(span["kind"], 0.0) + span["duration_ms"]
+        # Whatever no span covers: routing, Pydantic validation, serialization
+        totals["unattributed"] = max(self.duration_ms - sum(totals.values()), 0.0)
+        
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "reason": self.reason,
+            "status_code": self.status_code,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration_ms, 3),
+            "totals_ms": {kind: round(total, 3) for kind, total in totals.items()},
+            "spans": self.spans
+        }
+
+current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("current_trace", default=None)
+
+@contextmanager
+def profile_span(kind: str, name: str):
+    """Time a block against the current request trace, a no-op when not profiling"""
+    trace = current_trace.get()
+    if trace is None:
+        yield
+        return
+    
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add_span(kind, name, (time.perf_counter() - started) * 1000)
+
+class MongoProfilingListener:
+    """Records Motor commands as db spans; Motor runs them with the request context copied"""
+    
+    def __init__(self):
+        self.collections: Dict[int, Any] = {}
+    
+    def started(self, event):
+        if current_trace.get() is not None:
+            self.collections[event.request_id] = event.command.get(event.command_name)
+    
+    def succeeded(self, event):
+        self._record(event)
+    
+    def failed(self, event):
+        self._record(event, failed=True)
+    
+    def _record(self, event, failed: bool = False):
+        collection = self.collections.pop(event.request_id, None)
+        trace = current_trace.get()
+        if trace is None:
+            return
+        
+        name = f"{event.command_name} {collection}" if isinstance(collection, str) else event.command_name
+        details = {"failed": True} if failed else {}
+        trace.add_span("db", name, event.duration_micros / 1000, **details)
+
+class SlowTraceBuffer:
+    """Keeps the slowest traces seen, bounded to a fixed number"""
+    
+    def __init__(self, limit: int = PROFILE_TRACE_LIMIT):
+        self.limit = limit
+        self.heap: List[Any] = []
+        self.counter = itertools.count()
+    
+    def add(self, trace: RequestTrace):
+        item = (trace.duration_ms, next(self.counter), trace)
+        if len(self.heap) < self.limit:
+            heapq.heappush(self.heap, item)
+        elif trace.duration_ms > self.heap[0][0]:
+            heapq.heapreplace(self.heap, item)
+    
+    def slowest(self) -> List[RequestTrace]:
+        return [trace for _, _, trace in sorted(self.heap, reverse=True)]
+    
+    def clear(self):
+        self.heap = []
+
+slow_traces = SlowTraceBuffer()
+
+async def profiling_reason(scope) -> Optional[str]:
+    headers = dict(scope["headers"])
+    if headers.get(PROFILE_HEADER):
+        authorization = headers.get(b"authorization", b"").decode("latin-1")
+        scheme, _, token = authorization.partition(" ")
+        if scheme.lower() == "bearer" and token:
+            user = await get_user_from_token(token)
+            if user is not None and user.is_admin:
+                return "debug-header"
+    
+    if PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE:
+        return "sampled"
+    return None
+
+class RequestProfilingMiddleware:
+    """Traces sampled requests and admin requests carrying the debug header"""
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        reason = await profiling_reason(scope)
+        if reason is None:
+            await self.app(scope, receive, send)
+            return
+        
+        trace = RequestTrace(scope["method"], scope["path"], reason)
+        
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                trace.status_code = message["status"]
+            await send(message)
+        
+        token = current_trace.set(trace)
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            current_trace.reset(token)
+            trace.finish()
+            slow_traces.add(trace)
+
 # Auth Routes
 @api_router.post("/auth/register", response_model=Token)
 async def register(user_data: UserCreate):
@@ -378,6 +763,16 @@ async def execute_code(
     
     await db.code_executions.insert_one(execution_log.dict())
     
+    if result.error:
+        publish_classroom_event(
+            "error",
+            user_id=execution_log.user_id,
+            language=request.language,
+            tutorial_id=request.tutorial_id,
+            username=current_user.username if current_user else None,
+            error=result.error
+        )
+    
     return result
 
 # Progress Routes
@@ -409,7 +804,7 @@ async def save_progress(
         )
         
         updated_progress = await db.user_progress.find_one({"id": existing_progress["id"]})
-        return UserProgress(**updated_progress)
+        progress = UserProgress(**updated_progress)
     else:
         # Create new progress
         progress = UserProgress(
@@ -424,7 +819,17 @@ async def save_progress(
             progress.completion_time = datetime.utcnow()
             
         await db.user_progress.insert_one(progress.dict())
-        return progress
+    
+    # Only the transition to completed counts as a completion, later autosaves are progress
+    newly_completed = progress.completed and not (existing_progress or {}).get("completed")
+    publish_classroom_event(
+        "completion" if newly_completed else "progress",
+        user_id=current_user.id,
+        language=progress.language,
+        tutorial_id=progress.tutorial_id,
+        username=current_user.username
+    )
+    return progress
 
 @api_router.get("/progress", response_model=List[UserProgress])
 async def get_user_progress(current_user: User = Depends(get_current_user)):
@@ -443,27 +848,31 @@ async def get_language_progress(
     return [UserProgress(**progress) for progress in progress_list]
 
 # Admin Analytics Routes
-@api_router.get("/admin/dashboard", response_model=AdminDashboard)
-async def get_admin_dashboard(admin_user: User = Depends(get_admin_user)):
-    """Get comprehensive admin dashboard data"""
+# Admin analytics reports
+def query_time_limit(max_time_ms: Optional[int]) -> Dict[str, Any]:
+    return {"maxTimeMS": max_time_ms} if max_time_ms else {}
+
+async def build_admin_dashboard(max_time_ms: Optional[int] = None) -> AdminDashboard:
+    """Aggregate the admin dashboard from user and progress data"""
+    limits = query_time_limit(max_time_ms)
     
     # User statistics
-    total_users = await db.users.count_documents({})
+    total_users = await analytics_db.users.count_documents({}, **limits)
     
     today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
     week_ago = today - timedelta(days=7)
     
-    active_today = await db.user_progress.count_documents({
+    active_today = await analytics_db.user_progress.count_documents({
         "last_accessed": {"$gte": today}
-    })
+    }, **limits)
     
-    active_this_week = await db.user_progress.count_documents({
+    active_this_week = await analytics_db.user_progress.count_documents({
         "last_accessed": {"$gte": week_ago}
-    })
+    }, **limits)
     
-    new_this_week = await db.users.count_documents({
+    new_this_week = await analytics_db.users.count_documents({
         "created_at": {"$gte": week_ago}
-    })
+    }, **limits)
     
     user_stats = UserStats(
         total_users=total_users,
@@ -490,7 +899,7 @@ async def get_admin_dashboard(admin_user: User = Depends(get_admin_user)):
         }}
     ]
     
-    language_stats_cursor = db.user_progress.aggregate(language_pipeline)
+    language_stats_cursor = analytics_db.user_progress.aggregate(language_pipeline, **limits)
     language_stats = []
     
     async for stat in language_stats_cursor:
@@ -520,7 +929,7 @@ async def get_admin_dashboard(admin_user: User = Depends(get_admin_user)):
         }}
     ]
     
-    tutorial_stats_cursor = db.user_progress.aggregate(tutorial_pipeline)
+    tutorial_stats_cursor = analytics_db.user_progress.aggregate(tutorial_pipeline, **limits)
     tutorial_stats = []
     
     # Tutorial titles mapping
@@ -540,11 +949,11 @@ async def get_admin_dashboard(admin_user: User = Depends(get_admin_user)):
         ))
     
     # Recent activity
-    recent_activity_cursor = db.user_progress.find({}).sort("last_accessed", -1).limit(10)
+    recent_activity_cursor = analytics_db.user_progress.find({}).sort("last_accessed", -1).limit(10).max_time_ms(max_time_ms)
     recent_activity = []
     
     async for activity in recent_activity_cursor:
-        user = await db.users.find_one({"id": activity["user_id"]})
+        user = await analytics_db.users.find_one({"id": activity["user_id"]}, max_time_ms=max_time_ms)
         recent_activity.append({
             "username": user["username"] if user else "Unknown",
             "language": activity["language"],
@@ -560,25 +969,26 @@ async def get_admin_dashboard(admin_user: User = Depends(get_admin_user)):
         recent_activity=recent_activity
     )
 
-@api_router.get("/admin/users")
-async def get_users_analytics(admin_user: User = Depends(get_admin_user)):
-    """Get detailed user analytics"""
+async def build_users_analytics(max_time_ms: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Collect per-user progress and activity figures"""
+    limits = query_time_limit(max_time_ms)
     
-    users_cursor = db.users.find({}, {"hashed_password": 0})  # Exclude password
+    users_cursor = analytics_db.users.find({}, {"hashed_password": 0}).max_time_ms(max_time_ms)  # Exclude password
     users = []
     
     async for user in users_cursor:
         # Get user progress count
-        progress_count = await db.user_progress.count_documents({"user_id": user["id"]})
-        completions = await db.user_progress.count_documents({
+        progress_count = await analytics_db.user_progress.count_documents({"user_id": user["id"]}, **limits)
+        completions = await analytics_db.user_progress.count_documents({
             "user_id": user["id"],
             "completed": True
-        })
+        }, **limits)
         
         # Get last activity
-        last_progress = await db.user_progress.find_one(
+        last_progress = await analytics_db.user_progress.find_one(
             {"user_id": user["id"]},
-            sort=[("last_accessed", -1)]
+            sort=[("last_accessed", -1)],
+            max_time_ms=max_time_ms
         )
         
         user_data = {
@@ -596,9 +1006,9 @@ async def get_users_analytics(admin_user: User = Depends(get_admin_user)):
     
     return users
 
-@api_router.get("/admin/errors")
-async def get_common_errors(admin_user: User = Depends(get_admin_user)):
-    """Get common errors from code executions"""
+async def build_common_errors(limit: int = 20, max_time_ms: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Group failed code executions by language and error message"""
+    limits = query_time_limit(max_time_ms)
     
     error_pipeline = [
         {"$match": {"error": {"$ne": None}}},
@@ -610,10 +1020,10 @@ async def get_common_errors(admin_user: User = Depends(get_admin_user)):
             "count": {"$sum": 1}
         }},
         {"$sort": {"count": -1}},
-        {"$limit": 20}
+        {"$limit": limit}
     ]
     
-    errors_cursor = db.code_executions.aggregate(error_pipeline)
+    errors_cursor = analytics_db.code_executions.aggregate(error_pipeline, **limits)
     errors = []
     
     async for error in errors_cursor:
@@ -625,6 +1035,382 @@ async def get_common_errors(admin_user: User = Depends(get_admin_user)):
     
     return errors
 
+async def build_report(kind: str, params: Dict[str, Any]) -> Any:
+    if kind == "dashboard":
+        return (await build_admin_dashboard(REPORT_MAX_TIME_MS)).dict()
+    if kind == "users":
+        return await build_users_analytics(REPORT_MAX_TIME_MS)
+    return await build_common_errors(params.get("limit") or 20, REPORT_MAX_TIME_MS)
+
+def parquet_available() -> bool:
+    # pyarrow is optional (no musl wheels for the Alpine image); check without importing it
+    return any(importlib.util.find_spec(engine) for engine in ("pyarrow", "fastparquet"))
+
+def export_report_rows(rows: List[Dict[str, Any]], export_format: str) -> bytes:
+    """Serialize tabular report rows to CSV or Parquet with pandas"""
+    import pandas as pd
+    
+    frame = pd.DataFrame(rows)
+    if export_format == "csv":
+        return frame.to_csv(index=False).encode("utf-8")
+    buffer = io.BytesIO()
+    frame.to_parquet(buffer, index=False)
+    return buffer.getvalue()
+
+def serialize_report(data: Any, report_format: str) -> bytes:
+    if report_format == "json":
+        return json.dumps(jsonable_encoder(data)).encode("utf-8")
+    return export_report_rows(data, report_format)
+
+async def run_report_job(job: Dict[str, Any]) -> bytes:
+    data = await build_report(job["kind"], job["params"])
+    # Serialization is CPU bound, keep it off the event loop
+    return await asyncio.to_thread(serialize_report, data, job["format"])
+
+async def store_report_payload(job_id: str, payload: bytes, finished_at: datetime) -> int:
+    """Write a payload to db.report_payloads in chunks and return the chunk count"""
+    chunks = [
+        {"job_id": job_id, "n": n, "data": payload[offset:offset + REPORT_PAYLOAD_CHUNK_BYTES], "finished_at": finished_at}
+        for n, offset in enumerate(range(0, len(payload), REPORT_PAYLOAD_CHUNK_BYTES))
+    ] or [{"job_id": job_id, "n": 0, "data": b"", "finished_at": finished_at}]
+    
+    # A job requeued after a restart may have written part of its payload already
+    await db.report_payloads.delete_many({"job_id": job_id})
+    await db.report_payloads.insert_many(chunks)
+    return len(chunks)
+
+async def load_report_payload(job_id: str, chunk_count: int) -> Optional[bytes]:
+    chunks = await db.report_payloads.find({"job_id": job_id}).sort("n", 1).to_list(None)
+    if len(chunks) != chunk_count:
+        return None
+    return b"".join(bytes(chunk["data"]) for chunk in chunks)
+
+async def ensure_ttl_index(collection, field: str, expire_after_seconds: int):
+    from pymongo.errors import OperationFailure
+    
+    try:
+        await collection.create_index(field, expireAfterSeconds=expire_after_seconds)
+    except OperationFailure as e:
+        # IndexOptionsConflict: the retention period changed since the index was built
+        if e.code != 85:
+            raise
+        await collection.database.command(
+            "collMod",
+            collection.name,
+            index={"keyPattern": {field: 1}, "expireAfterSeconds": expire_after_seconds}
+        )
+
+class ReportJobRunner:
+    """In-process workers draining report jobs persisted in db.report_jobs"""
+    
+    def __init__(self, workers: int = REPORT_WORKERS):
+        self.workers = workers
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.running: Dict[str, asyncio.Task] = {}
+        self.cancelled: Set[str] = set()
+        self.setup_task: Optional[asyncio.Task] = None
+        self.worker_tasks: List[asyncio.Task] = []
+    
+    def start(self):
+        # Startup must not wait on Mongo; setup and workers come up in the background
+        self.setup_task = asyncio.create_task(self._setup())
+    
+    async def stop(self):
+        tasks = self.worker_tasks + ([self.setup_task] if self.setup_task else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.setup_task = None
+        self.worker_tasks = []
+    
+    async def _setup(self):
+        delay = REPORT_SETUP_RETRY_SECONDS
+        while True:
+            try:
+                await self._prepare()
+                break
+            except Exception as e:
+                logger.warning(f"Report job setup failed, retrying in {delay}s: {str(e)}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, REPORT_SETUP_MAX_RETRY_SECONDS)
+        
+        self.worker_tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+    
+    async def _prepare(self):
+        await db.report_jobs.create_index("id", unique=True)
+        await db.report_jobs.create_index([("params_key", 1), ("created_at", -1)])
+        await ensure_ttl_index(db.report_jobs, "finished_at", REPORT_RETENTION_SECONDS)
+        await db.report_payloads.create_index([("job_id", 1), ("n", 1)], unique=True)
+        await ensure_ttl_index(db.report_payloads, "finished_at", REPORT_RETENTION_SECONDS)
+        
+        # Jobs interrupted by a restart are picked up again
+        await db.report_jobs.update_many(
+            {"status": "running"},
+            {"$set": {"status": "queued", "started_at": None}}
+        )
+        async for job in db.report_jobs.find({"status": "queued"}, {"id": 1}).sort("created_at", 1):
+            self.queue.put_nowait(job["id"])
+    
+    def submit(self, job_id: str):
+        self.queue.put_nowait(job_id)
+    
+    def cancel(self, job_id: str):
+        # Remembered even before the job runs here, a claim may be in flight
+        self.cancelled.add(job_id)
+        task = self.running.get(job_id)
+        if task is not None:
+            task.cancel()
+    
+    async def _work(self):
+        while True:
+            job_id = await self.queue.get()
+            try:
+                await self._run(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # A transient Mongo error must not end the worker; the claim only
+                # matches queued jobs, so retrying a job that got further is harmless
+                logger.error(f"Report worker error on job {job_id}, retrying: {str(e)}")
+                asyncio.get_running_loop().call_later(REPORT_SETUP_RETRY_SECONDS, self.queue.put_nowait, job_id)
+    
+    async def _run(self, job_id: str):
+        from pymongo import ReturnDocument
+        
+        job = await db.report_jobs.find_one_and_update(
+            {"id": job_id, "status": "queued"},
+            {"$set": {"status": "running", "started_at": datetime.utcnow()}},
+            return_document=ReturnDocument.AFTER
+        )
+        if job is None:
+            # Cancelled or already claimed
+            self.cancelled.discard(job_id)
+            return
+        
+        task = asyncio.create_task(run_report_job(job))
+        self.running[job_id] = task
+        try:
+            if job_id in self.cancelled:
+                task.cancel()
+            payload = await task
+            if job_id in self.cancelled:
+                return
+            
+            finished_at = datetime.utcnow()
+            chunk_count = await store_report_payload(job_id, payload, finished_at)
+            await db.report_jobs.update_one(
+                {"id": job_id, "status": "running"},
+                {"$set": {
+                    "status": "completed",
+                    "finished_at": finished_at,
+                    "payload_chunks": chunk_count,
+                    "payload_size": len(payload)
+                }}
+            )
+        except asyncio.CancelledError:
+            if job_id not in self.cancelled:
+                raise
+        except Exception as e:
+            logger.error(f"Report job {job_id} failed: {str(e)}")
+            await db.report_jobs.update_one(
+                {"id": job_id, "status": "running"},
+                {"$set": {"status": "failed", "error": str(e), "finished_at": datetime.utcnow()}}
+            )
+        finally:
+            self.running.pop(job_id, None)
+            self.cancelled.discard(job_id)
+
+report_runner = ReportJobRunner()
+
+async def run_analytics_query(query):
+    """Await a time-limited analytics query, turning a server-side timeout into a 504"""
+    from pymongo.errors import ExecutionTimeout
+    
+    try:
+        return await query
+    except ExecutionTimeout:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail="Analytics query exceeded its time limit, request it as a background report instead"
+        )
+
+@api_router.get("/admin/dashboard", response_model=AdminDashboard)
+async def get_admin_dashboard(admin_user: User = Depends(get_admin_user)):
+    """Get comprehensive admin dashboard data"""
+    return await run_analytics_query(build_admin_dashboard(ANALYTICS_MAX_TIME_MS))
+
+@api_router.get("/admin/users")
+async def get_users_analytics(admin_user: User = Depends(get_admin_user)):
+    """Get detailed user analytics"""
+    return await run_analytics_query(build_users_analytics(ANALYTICS_MAX_TIME_MS))
+
+@api_router.get("/admin/errors")
+async def get_common_errors(admin_user: User = Depends(get_admin_user)):
+    """Get common errors from code executions"""
+    return await run_analytics_query(build_common_errors(max_time_ms=ANALYTICS_MAX_TIME_MS))
+
+@api_router.post("/admin/jobs", response_model=ReportJob)
+async def create_report_job(
+    request: ReportJobRequest,
+    admin_user: User = Depends(get_admin_user)
+):
+    """Queue a report, reusing a pending or recently completed job with the same parameters"""
+    if request.kind not in REPORT_KINDS:
+        raise HTTPException(status_code=400, detail=f"Unknown report kind: {request.kind}")
+    if request.format not in REPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format: {request.format}")
+    if request.format != "json" and request.kind not in REPORT_TABULAR_KINDS:
+        raise HTTPException(status_code=400, detail=f"The {request.kind} report can only be exported as json")
+    if request.format == "parquet" and not parquet_available():
+        raise HTTPException(status_code=400, detail="Parquet export unavailable, install pyarrow to enable it")
+    
+    params = {"limit": request.limit} if request.kind == "errors" and request.limit else {}
+    params_key = json.dumps({"kind": request.kind, "format": request.format, "params": params}, sort_keys=True)
+    
+    if not request.refresh:
+        fresh_since = datetime.utcnow() - timedelta(seconds=REPORT_CACHE_TTL_SECONDS)
+        existing = await db.report_jobs.find_one(
+            {
+                "params_key": params_key,
+                "$or": [
+                    {"status": {"$in": ["queued", "running"]}},
+                    {"status": "completed", "finished_at": {"$gte": fresh_since}}
+                ]
+            },
+            sort=[("created_at", -1)]
+        )
+        if existing:
+            return ReportJob(**existing)
+    
+    job = ReportJob(
+        kind=request.kind,
+        format=request.format,
+        params=params,
+        params_key=params_key,
+        requested_by=admin_user.id
+    )
+    await db.report_jobs.insert_one(job.dict())
+    report_runner.submit(job.id)
+    return job
+
+@api_router.get("/admin/jobs", response_model=List[ReportJob])
+async def list_report_jobs(limit: int = 50, admin_user: User = Depends(get_admin_user)):
+    jobs = await db.report_jobs.find({}).sort("created_at", -1).limit(limit).to_list(limit)
+    return [ReportJob(**job) for job in jobs]
+
+@api_router.get("/admin/jobs/{job_id}", response_model=ReportJob)
+async def get_report_job(job_id: str, admin_user: User = Depends(get_admin_user)):
+    job = await db.report_jobs.find_one({"id": job_id})
+    if job is None:
+        raise HTTPException(status_code=404, detail="Report job not found")
+    return ReportJob(**job)
+
+@api_router.get("/admin/jobs/{job_id}/result")
+async def get_report_job_result(job_id: str, admin_user: User = Depends(get_admin_user)):
+    job = await db.report_jobs.find_one({"id": job_id})
+    if job is None:
+        raise HTTPException(status_code=404, detail="Report job not found")
+    if job["status"] != "completed":
+        raise HTTPException(status_code=409, detail=f"Report job is {job['status']}")
+    
+    payload = await load_report_payload(job_id, job.get("payload_chunks", 0))
+    if payload is None:
+        raise HTTPException(status_code=410, detail="Report payload has expired")
+    
+    if job["format"] == "json":
+        return Response(content=payload, media_type="application/json")
+    media_type = "text/csv" if job["format"] == "csv" else "application/vnd.apache.parquet"
+    return Response(
+        content=payload,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{job["kind"]}-{job_id}.{job["format"]}"'}
+    )
+
+@api_router.delete("/admin/jobs/{job_id}", response_model=ReportJob)
+async def cancel_report_job(job_id: str, admin_user: User = Depends(get_admin_user)):
+    from pymongo import ReturnDocument
+    
+    job = await db.report_jobs.find_one_and_update(
+        {"id": job_id, "status": {"$in": ["queued", "running"]}},
+        {"$set": {"status": "cancelled", "finished_at": datetime.utcnow()}},
+        return_document=ReturnDocument.AFTER
+    )
+    if job is None:
+        existing = await db.report_jobs.find_one({"id": job_id}, {"id": 1})
+        if existing is None:
+            raise HTTPException(status_code=404, detail="Report job not found")
+        raise HTTPException(status_code=409, detail="Report job has already finished")
+    
+    report_runner.cancel(job_id)
+    return ReportJob(**job)
+
+@api_router.get("/admin/traces")
+async def get_request_traces(admin_user: User = Depends(get_admin_user)):
+    """Get the slowest profiled requests, slowest first"""
+    return {
+        "enabled": PROFILE_REQUESTS,
+        "sample_rate": PROFILE_SAMPLE_RATE,
+        "traces": [trace.to_dict() for trace in slow_traces.slowest()]
+    }
+
+@api_router.delete("/admin/traces")
+async def clear_request_traces(admin_user: User = Depends(get_admin_user)):
+    slow_traces.clear()
+    return {"cleared": True}
+
+async def authenticate_classroom_socket(websocket: WebSocket) -> Optional[str]:
+    """Read the {"token": ..., "room": ...} auth message and return the room to join"""
+    # The token is sent as a message rather than in the URL so it never reaches access logs
+    try:
+        frame = await asyncio.wait_for(websocket.receive(), timeout=CLASSROOM_AUTH_TIMEOUT)
+    except asyncio.TimeoutError:
+        return None
+    # Binary frames and disconnects carry no text
+    if frame.get("text") is None:
+        return None
+    try:
+        message = json.loads(frame["text"])
+    except ValueError:
+        return None
+    if not isinstance(message, dict) or not isinstance(message.get("token"), str):
+        return None
+    
+    user = await get_user_from_token(message["token"])
+    if user is None:
+        return None
+    
+    own_room = f"user:{user.id}"
+    room = message.get("room") or ("all" if user.is_admin else own_room)
+    if not user.is_admin and room != own_room:
+        return None
+    return room
+
+@api_router.websocket("/ws/classroom")
+async def classroom_socket(websocket: WebSocket):
+    """Push progress, completion and error events for a room.
+    
+    The first client message must be {"token": "<jwt>", "room": "<room>"}.
+    Admins may join "all", "language:<name>" or "user:<id>"; students may only
+    follow their own "user:<id>" room, which is also the default for them.
+    """
+    await websocket.accept()
+    room = await authenticate_classroom_socket(websocket)
+    if room is None:
+        try:
+            await websocket.close(code=1008)
+        except Exception:
+            pass
+        return
+    
+    connection = classroom_hub.connect(websocket, {room})
+    try:
+        await websocket.send_json({"type": "subscribed", "room": room})
+        await connection.run()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        classroom_hub.disconnect(connection)
+
 # Existing routes with auth integration
 @api_router.get("/")
 async def root():
@@ -683,6 +1469,8 @@ Guidelines:
             system_message += f"\n\nCurrent tutorial ID: {request.tutorial_id}"
 
         # Initialize Gemini chat
+        from emergentintegrations.llm.chat import LlmChat, UserMessage
+        
         chat = LlmChat(
             api_key=gemini_api_key,
             session_id=request.session_id,
@@ -693,7 +1481,8 @@ Guidelines:
         user_message = UserMessage(text=request.message)
         
         # Get AI response
-        response = await chat.send_message(user_message)
+        with profile_span("http", "gemini chat"):
+            response = await chat.send_message(user_message)
         
         # Save conversation to database
         chat_record = ChatMessage(
@@ -733,17 +1522,6 @@ async def get_chat_history(
         logger.error(f"Error getting chat history: {str(e)}")
         raise HTTPException(status_code=500, detail="Error retrieving chat history")
 
-# Include the router in the main app
-app.include_router(api_router)
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_credentials=True,
-    allow_origins=["*"],
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -751,6 +1529,40 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    connect_db()
+    report_runner.start()
+    
+    startup_time = time.perf_counter() - STARTUP_STARTED
+    if startup_time > STARTUP_BUDGET_SECONDS:
+        logger.warning(f"Startup took {startup_time:.3f}s, over the {STARTUP_BUDGET_SECONDS:.3f}s budget")
+    else:
+        logger.info(f"Startup completed in {startup_time:.3f}s")
+    
+    try:
+        yield
+    finally:
+        await report_runner.stop()
+        analytics_client.close()
+        client.close()
+
+def create_app() -> FastAPI:
+    # Create the main app without a prefix
+    app = FastAPI(lifespan=lifespan)
+    
+    # Include the router in the main app
+    app.include_router(api_router)
+    
+    app.add_middleware(
+        CORSMiddleware,
+        allow_credentials=True,
+        allow_origins=["*"],
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    if PROFILE_REQUESTS:
+        app.add_middleware(RequestProfilingMiddleware)
+    return app
+
+app = create_app()
\ No newline at end of file
@@ -0,0 +1,130 @@
+import asyncio
+
+import server
+
+
+class FakeWebSocket:
+    def __init__(self, send_delay: float = 0):
+        self.send_delay = send_delay
+        self.sent = []
+        self.closed_with = None
+        self.incoming: asyncio.Queue = asyncio.Queue()
+
+    async def send_json(self, event):
+        if self.send_delay:
+            await asyncio.sleep(self.send_delay)
+        self.sent.append(event)
+
+    async def receive_text(self):
+        return await self.incoming.get()
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        self.closed_with = code
+
+
+async def settle():
+    await asyncio.sleep(0.01)
+
+
+def test_publish_fans_out_once_per_connection():
+    async def scenario():
+        hub = server.ClassroomHub(max_buffer=10)
+        admin = FakeWebSocket()
+        student = FakeWebSocket()
+        admin_connection = hub.connect(admin, {"all", "language:python"})
+        student_connection = hub.connect(student, {"user:u1"})
+        runs = [asyncio.create_task(c.run()) for c in (admin_connection, student_connection)]
+
+        hub.publish(["all", "language:python", "user:u1"], {"type": "progress"})
+        hub.publish(["all", "language:java"], {"type": "error"})
+        await settle()
+
+        assert admin.sent == [{"type": "progress"}, {"type": "error"}]
+        assert student.sent == [{"type": "progress"}]
+
+        for run in runs:
+            run.cancel()
+        await asyncio.gather(*runs, return_exceptions=True)
+
+    asyncio.run(scenario())
+
+
+def test_slow_consumer_is_dropped_while_others_keep_receiving():
+    async def scenario():
+        hub = server.ClassroomHub(max_buffer=1)
+        slow = FakeWebSocket(send_delay=60)
+        fast = FakeWebSocket()
+        slow_connection = hub.connect(slow, {"all"})
+        fast_connection = hub.connect(fast, {"all"})
+        slow_run = asyncio.create_task(slow_connection.run())
+        fast_run = asyncio.create_task(fast_connection.run())
+
+        for i in range(3):
+            hub.publish(["all"], {"n": i})
+            await settle()
+
+        await asyncio.wait_for(slow_run, timeout=1)
+        assert slow.closed_with == 1013
+        assert slow_connection not in hub.rooms.get("all", set())
+        assert fast.sent == [{"n": 0}, {"n": 1}, {"n": 2}]
+
+        fast_run.cancel()
+        await asyncio.gather(fast_run, return_exceptions=True)
+
+    asyncio.run(scenario())
+
+
+def test_send_timeout_closes_consumer_with_1013(monkeypatch):
+    monkeypatch.setattr(server, "CLASSROOM_SEND_TIMEOUT", 0.01)
+
+    async def scenario():
+        hub = server.ClassroomHub(max_buffer=10)
+        stuck = FakeWebSocket(send_delay=60)
+        connection = hub.connect(stuck, {"all"})
+        run = asyncio.create_task(connection.run())
+
+        hub.publish(["all"], {"type": "progress"})
+        await asyncio.wait_for(run, timeout=1)
+
+        assert connection.dropped.is_set()
+        assert stuck.closed_with == 1013
+
+    asyncio.run(scenario())
+
+
+def classroom_client(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    async def get_user_from_token(token):
+        if token != "valid":
+            return None
+        return server.User(id="u1", username="student", email="student@example.com")
+
+    monkeypatch.setattr(server, "get_user_from_token", get_user_from_token)
+    return TestClient(server.create_app())
+
+
+def test_socket_joins_own_room_after_auth_message(monkeypatch):
+    client = classroom_client(monkeypatch)
+    with client.websocket_connect("/api/ws/classroom") as websocket:
+        websocket.send_json({"token": "valid"})
+        assert websocket.receive_json() == {"type": "subscribed", "room": "user:u1"}
+
+
+def test_socket_rejects_bad_first_frames_with_1008(monkeypatch):
+    from starlette.websockets import WebSocketDisconnect
+
+    client = classroom_client(monkeypatch)
+    for send in (
+        lambda websocket: websocket.send_bytes(b"\x00\x01"),
+        lambda websocket: websocket.send_text("not json"),
+        lambda websocket: websocket.send_json({"token": "expired"}),
+        lambda websocket: websocket.send_json({"token": "valid", "room": "all"}),
+    ):
+        with client.websocket_connect("/api/ws/classroom") as websocket:
+            send(websocket)
+            try:
+                websocket.receive_json()
+                raise AssertionError("socket was not closed")
+            except WebSocketDisconnect as e:
+                assert e.code == 1008
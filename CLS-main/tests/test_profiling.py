@@ -0,0 +1,62 @@
+from types import SimpleNamespace
+
+import server
+
+
+def make_trace(duration_ms):
+    trace = server.RequestTrace("GET", f"/api/{duration_ms}", "sampled")
+    trace.duration_ms = duration_ms
+    return trace
+
+
+def test_buffer_keeps_only_the_slowest_traces():
+    buffer = server.SlowTraceBuffer(limit=3)
+    for duration_ms in [5, 50, 1, 30, 10, 40]:
+        buffer.add(make_trace(duration_ms))
+
+    assert [trace.duration_ms for trace in buffer.slowest()] == [50, 40, 30]
+
+
+def test_buffer_clear_drops_all_traces():
+    buffer = server.SlowTraceBuffer(limit=3)
+    buffer.add(make_trace(5))
+    buffer.clear()
+
+    assert buffer.slowest() == []
+
+
+def test_profile_span_records_only_inside_a_trace():
+    with server.profile_span("cpu", "outside"):
+        pass
+
+    trace = server.RequestTrace("POST", "/api/auth/login", "debug-header")
+    token = server.current_trace.set(trace)
+    try:
+        with server.profile_span("cpu", "bcrypt verify"):
+            pass
+    finally:
+        server.current_trace.reset(token)
+    trace.finish()
+
+    assert [span["name"] for span in trace.spans] == ["bcrypt verify"]
+    assert set(trace.to_dict()["totals_ms"]) == {"cpu", "unattributed"}
+
+
+def test_mongo_listener_records_commands_against_the_current_trace():
+    listener = server.MongoProfilingListener()
+    trace = server.RequestTrace("GET", "/api/progress", "sampled")
+    token = server.current_trace.set(trace)
+    try:
+        listener.started(SimpleNamespace(request_id=1, command_name="find", command={"find": "user_progress"}))
+        listener.succeeded(SimpleNamespace(request_id=1, command_name="find", duration_micros=2500))
+        listener.started(SimpleNamespace(request_id=2, command_name="insert", command={"insert": "users"}))
+        listener.failed(SimpleNamespace(request_id=2, command_name="insert", duration_micros=1000))
+    finally:
+        server.current_trace.reset(token)
+
+    assert [(span["name"], span["duration_ms"]) for span in trace.spans] == [
+        ("find user_progress", 2.5),
+        ("insert users", 1.0),
+    ]
+    assert trace.spans[1]["failed"] is True
+    assert listener.collections == {}
@@ -0,0 +1,254 @@
+import asyncio
+
+import pytest
+
+import server
+
+
+def matches(document, query):
+    for key, expected in query.items():
+        value = document.get(key)
+        if isinstance(expected, dict) and "$in" in expected:
+            if value not in expected["$in"]:
+                return False
+        elif value != expected:
+            return False
+    return True
+
+
+class FakeCursor:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def sort(self, key, direction=1):
+        self.documents.sort(key=lambda document: document.get(key), reverse=direction < 0)
+        return self
+
+    async def to_list(self, length):
+        return list(self.documents)
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for document in self.documents:
+            yield document
+
+
+class FakeCollection:
+    """Just enough of a Motor collection for the report job runner"""
+
+    def __init__(self, fail_setup: int = 0):
+        self.documents = []
+        self.fail_setup = fail_setup
+        self.fail_claims = 0
+        self.on_claim = None
+
+    async def create_index(self, keys, **kwargs):
+        if self.fail_setup:
+            self.fail_setup -= 1
+            raise ConnectionError("server selection timed out")
+
+    def find(self, query, projection=None):
+        return FakeCursor([document for document in self.documents if matches(document, query)])
+
+    async def find_one(self, query):
+        return next((document for document in self.documents if matches(document, query)), None)
+
+    async def find_one_and_update(self, query, update, return_document=None):
+        if self.fail_claims:
+            self.fail_claims -= 1
+            raise ConnectionError("primary stepped down")
+        document = await self.find_one(query)
+        if document is not None:
+            document.update(update["$set"])
+            if self.on_claim:
+                self.on_claim(document)
+        return document
+
+    async def update_one(self, query, update):
+        document = await self.find_one(query)
+        if document is not None:
+            document.update(update["$set"])
+
+    async def update_many(self, query, update):
+        for document in self.documents:
+            if matches(document, query):
+                document.update(update["$set"])
+
+    async def insert_many(self, documents):
+        self.documents.extend(documents)
+
+    async def delete_many(self, query):
+        self.documents = [document for document in self.documents if not matches(document, query)]
+
+
+class FakeDatabase:
+    def __init__(self, fail_setup: int = 0):
+        self.report_jobs = FakeCollection(fail_setup)
+        self.report_payloads = FakeCollection()
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    database = FakeDatabase()
+    monkeypatch.setattr(server, "db", database)
+    monkeypatch.setattr(server, "ensure_ttl_index", lambda collection, field, seconds: asyncio.sleep(0))
+    return database
+
+
+def queued_job(job_id, status="queued"):
+    return {"id": job_id, "kind": "errors", "format": "csv", "params": {}, "status": status, "created_at": job_id}
+
+
+async def settle():
+    await asyncio.sleep(0.01)
+
+
+def test_job_cancelled_while_queued_is_never_claimed(fake_db, monkeypatch):
+    ran = []
+
+    async def run_report_job(job):
+        ran.append(job["id"])
+        return b""
+
+    monkeypatch.setattr(server, "run_report_job", run_report_job)
+    fake_db.report_jobs.documents.append(queued_job("j1", status="cancelled"))
+
+    async def scenario():
+        runner = server.ReportJobRunner(workers=1)
+        worker = asyncio.create_task(runner._work())
+        runner.submit("j1")
+        await settle()
+        worker.cancel()
+        await asyncio.gather(worker, return_exceptions=True)
+
+    asyncio.run(scenario())
+    assert ran == []
+    assert fake_db.report_jobs.documents[0]["status"] == "cancelled"
+
+
+def test_cancelling_a_running_job_keeps_the_worker_alive(fake_db, monkeypatch):
+    async def run_report_job(job):
+        await asyncio.sleep(60)
+
+    monkeypatch.setattr(server, "run_report_job", run_report_job)
+    fake_db.report_jobs.documents.append(queued_job("j1"))
+
+    async def scenario():
+        runner = server.ReportJobRunner(workers=1)
+        worker = asyncio.create_task(runner._work())
+        runner.submit("j1")
+        await settle()
+        assert "j1" in runner.running
+
+        fake_db.report_jobs.documents[0]["status"] = "cancelled"
+        runner.cancel("j1")
+        await settle()
+
+        assert runner.running == {}
+        assert not worker.done()
+        worker.cancel()
+        await asyncio.gather(worker, return_exceptions=True)
+
+    asyncio.run(scenario())
+    assert fake_db.report_jobs.documents[0]["status"] == "cancelled"
+    assert fake_db.report_payloads.documents == []
+
+
+def test_setup_retries_and_requeues_interrupted_jobs(monkeypatch):
+    database = FakeDatabase(fail_setup=1)
+    monkeypatch.setattr(server, "db", database)
+    monkeypatch.setattr(server, "ensure_ttl_index", lambda collection, field, seconds: asyncio.sleep(0))
+    monkeypatch.setattr(server, "REPORT_PAYLOAD_CHUNK_BYTES", 4)
+    monkeypatch.setattr(server, "REPORT_SETUP_RETRY_SECONDS", 0.01)
+
+    async def run_report_job(job):
+        return b"id,count\n1,2\n"
+
+    monkeypatch.setattr(server, "run_report_job", run_report_job)
+    database.report_jobs.documents.append(queued_job("j1", status="running"))
+
+    async def scenario():
+        runner = server.ReportJobRunner(workers=1)
+        runner.start()
+        for _ in range(50):
+            if database.report_jobs.documents[0]["status"] == "completed":
+                break
+            await asyncio.sleep(0.05)
+        await runner.stop()
+
+        job = database.report_jobs.documents[0]
+        assert job["status"] == "completed"
+        assert job["payload_chunks"] == 4
+        assert await server.load_report_payload("j1", job["payload_chunks"]) == b"id,count\n1,2\n"
+
+    asyncio.run(scenario())
+
+
+def test_missing_payload_chunks_are_reported_as_expired(fake_db):
+    async def scenario():
+        await server.store_report_payload("j1", b"payload", server.datetime.utcnow())
+        fake_db.report_payloads.documents.clear()
+        return await server.load_report_payload("j1", 1)
+
+    assert asyncio.run(scenario()) is None
+
+
+def test_worker_survives_a_failed_claim(fake_db, monkeypatch):
+    monkeypatch.setattr(server, "REPORT_SETUP_RETRY_SECONDS", 0.01)
+
+    async def run_report_job(job):
+        return b"done"
+
+    monkeypatch.setattr(server, "run_report_job", run_report_job)
+    fake_db.report_jobs.documents.extend([queued_job("j1"), queued_job("j2")])
+    fake_db.report_jobs.fail_claims = 1
+
+    async def scenario():
+        runner = server.ReportJobRunner(workers=1)
+        worker = asyncio.create_task(runner._work())
+        runner.submit("j1")
+        runner.submit("j2")
+        await asyncio.sleep(0.05)
+
+        assert not worker.done()
+        worker.cancel()
+        await asyncio.gather(worker, return_exceptions=True)
+
+    asyncio.run(scenario())
+    assert [job["status"] for job in fake_db.report_jobs.documents] == ["completed", "completed"]
+
+
+def test_job_cancelled_during_its_claim_never_stores_a_payload(fake_db, monkeypatch):
+    ran = []
+
+    async def run_report_job(job):
+        ran.append(job["id"])
+        return b"payload"
+
+    monkeypatch.setattr(server, "run_report_job", run_report_job)
+    fake_db.report_jobs.documents.append(queued_job("j1"))
+
+    async def scenario():
+        runner = server.ReportJobRunner(workers=1)
+
+        def cancel_after_claim(job):
+            # What DELETE /admin/jobs/{id} does between the claim and the worker resuming
+            job["status"] = "cancelled"
+            runner.cancel(job["id"])
+
+        fake_db.report_jobs.on_claim = cancel_after_claim
+        worker = asyncio.create_task(runner._work())
+        runner.submit("j1")
+        await settle()
+
+        assert runner.cancelled == set()
+        assert not worker.done()
+        worker.cancel()
+        await asyncio.gather(worker, return_exceptions=True)
+
+    asyncio.run(scenario())
+    assert ran == []
+    assert fake_db.report_jobs.documents[0]["status"] == "cancelled"
+    assert fake_db.report_payloads.documents == []
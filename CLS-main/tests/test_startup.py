@@ -0,0 +1,48 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from tests.conftest import BACKEND_DIR
+
+# Cold starts and worker recycling should stay well under a second
+STARTUP_BUDGET_SECONDS = float(os.getenv("STARTUP_BUDGET_SECONDS", "1.0"))
+
+LAZY_MODULES = ["emergentintegrations", "passlib", "requests", "pandas", "motor", "pymongo"]
+
+
+@pytest.fixture(scope="module")
+def timings():
+    env = {key: value for key, value in os.environ.items() if key not in ("MONGO_URL", "DB_NAME")}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import server"],
+        cwd=BACKEND_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        timeout=60,
+    )
+    assert result.returncode == 0, result.stderr
+
+    # Lines look like "import time:       120 |        450 |   package.module"
+    timings = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative, module = line[len("import time:"):].split("|")
+        timings[module.strip()] = int(cumulative)
+    return timings
+
+
+def test_server_imports_within_startup_budget(timings):
+    assert "server" in timings
+    assert timings["server"] / 1_000_000 < STARTUP_BUDGET_SECONDS
+
+
+def test_heavy_dependencies_are_not_imported_at_startup(timings):
+    eager = [
+        module for module in timings
+        if any(module == lazy or module.startswith(lazy + ".") for lazy in LAZY_MODULES)
+    ]
+    assert eager == []